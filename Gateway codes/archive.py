@@ -1,8 +1,10 @@
 import sqlite3
-import csv
 import gzip
+import io
 import os
 import logging
+import queue
+import threading
 from datetime import datetime, timedelta
 import traceback
 
@@ -12,6 +14,43 @@ DATABASE_FILE = os.environ.get('SETU_DB_PATH', 'setu_gateway.db')
 ARCHIVE_DIR = os.environ.get('SETU_ARCHIVE_DIR', 'archive')
 # ARCHIVE_DAYS_THRESHOLD can also be an environment variable if needed
 ARCHIVE_DAYS_THRESHOLD = int(os.environ.get('SETU_ARCHIVE_DAYS', 365))
+# Number of rows deleted per transaction during the purge phase
+PURGE_CHUNK_SIZE = int(os.environ.get('SETU_PURGE_CHUNK_SIZE', 5000))
+# CSV buffer size handed to the compression thread, and how many filled
+# buffers may be in flight before the row collector blocks
+CSV_BUFFER_BYTES = 1024 * 1024
+CSV_BUFFER_DEPTH = 4
+# gzip level for the archive file. The default (9) burns maximum CPU for a
+# marginal ratio gain on repetitive numeric CSV; level 3 is several times
+# faster on the Pi's ARM cores for nearly the same output size.
+GZIP_LEVEL = int(os.environ.get('SETU_ARCHIVE_GZIP_LEVEL', 3))
+# Rows between buffer-size checks while collecting (avoids a flush per row)
+CSV_FLUSH_INTERVAL = 1000
+
+
+def _compress_buffers(gz_file, buffer_q: queue.Queue, errors: list):
+    """
+    Writer-side of the archive double-buffer: consumes filled CSV byte
+    buffers from the queue and feeds them through the gzip stream. Runs on
+    its own thread so zlib deflate (CPU-bound) overlaps with SQLite row
+    fetching on the main thread. A None sentinel ends the loop.
+
+    A failed write (disk full is the expected failure mode on an SD card)
+    is recorded in `errors` rather than killing the thread: the loop keeps
+    draining and discarding buffers so the producer's bounded put() can
+    never deadlock against a dead consumer, and the main thread re-raises
+    the recorded error before any rows are purged.
+    """
+    while True:
+        chunk = buffer_q.get()
+        if chunk is None:
+            break
+        if errors:
+            continue  # Already failed; keep draining so the producer finishes
+        try:
+            gz_file.write(chunk)
+        except Exception as e:
+            errors.append(e)
 
 # --- Logging Setup ---
 # Configure logging for cron job output redirection
@@ -50,35 +89,106 @@ def archive_and_purge():
         conn = sqlite3.connect(db_path, timeout=10)
         cursor = conn.cursor()
 
-        # 2. Select old records
-        logging.info(f"Selecting records from fatigue_log older than {cutoff_date}...")
-        cursor.execute("SELECT * FROM fatigue_log WHERE timestamp < ?", (cutoff_date,))
-        records = cursor.fetchall()
+        # 2. Check whether there is anything to archive (cheap COUNT for early exit)
+        cursor.execute("SELECT COUNT(*) FROM fatigue_log WHERE timestamp < ?", (cutoff_date,))
+        record_count = cursor.fetchone()[0]
 
-        if not records:
+        if record_count == 0:
             logging.info("No records old enough to archive. Process finished.")
             return
 
-        logging.info(f"Found {len(records)} records to archive.")
+        logging.info(f"Found {record_count} records to archive.")
+
+        # 3. Export to a compressed CSV file, streaming rows directly from the
+        # cursor. sqlite3 cursors are iterable, so rows flow one at a time from
+        # SQLite into the gzip stream instead of being buffered in a Python
+        # list. This keeps memory bounded even if fatigue_log holds millions
+        # of rows on a Pi with limited RAM.
+        cursor.execute("SELECT * FROM fatigue_log WHERE timestamp < ?", (cutoff_date,))
         header = [description[0] for description in cursor.description]
 
-        # 3. Export to a compressed CSV file
         archive_filename = f"fatigue_log_archive_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.csv.gz"
         archive_filepath = os.path.join(archive_path, archive_filename)
-        
+
         logging.info(f"Writing records to archive file: {archive_filepath}")
-        with gzip.open(archive_filepath, 'wt', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(header)
-            writer.writerows(records)
+        # Double-buffered export: this thread renders rows into ~1MB CSV
+        # buffers while a companion thread gzips full buffers to disk, so
+        # SQLite decode and zlib deflate run in parallel instead of
+        # alternating row by row.
+        buffer_q = queue.Queue(maxsize=CSV_BUFFER_DEPTH)
+        compress_errors = []
+        with gzip.open(archive_filepath, 'wb', compresslevel=GZIP_LEVEL) as f:
+            compressor = threading.Thread(
+                target=_compress_buffers, args=(f, buffer_q, compress_errors),
+                name="ArchiveGzip")
+            compressor.start()
+            try:
+                # fatigue_log rows are integers plus an ISO-8601 timestamp:
+                # no field can contain a comma, quote or newline, so the
+                # csv module's per-field escaping machinery is pure overhead
+                # here. A plain join produces identical output (same \r\n
+                # line endings csv.writer would emit). If a text column is
+                # ever added to this table, switch back to csv.writer.
+                buf = io.BytesIO()
+                buf.write((','.join(header) + '\r\n').encode())
+                rows_since_check = 0
+                for row in cursor:
+                    buf.write(','.join(map(str, row)).encode() + b'\r\n')
+                    rows_since_check += 1
+                    if rows_since_check >= CSV_FLUSH_INTERVAL:
+                        rows_since_check = 0
+                        if buf.tell() >= CSV_BUFFER_BYTES:
+                            if compress_errors:
+                                break  # Writer failed; error re-raised below
+                            # Bounded put: the compressor drains even after a
+                            # failure, so this can block only briefly; the
+                            # timeout is a last-resort guard against hanging
+                            # the cron job.
+                            buffer_q.put(buf.getvalue(), timeout=60)
+                            buf.seek(0)
+                            buf.truncate()
+                # Hand off whatever is left in the final partial buffer
+                if buf.tell() and not compress_errors:
+                    buffer_q.put(buf.getvalue(), timeout=60)
+            finally:
+                buffer_q.put(None)  # Sentinel: no more buffers
+                compressor.join()
+
+        # CRITICAL: surface any compressor-side failure BEFORE the purge.
+        # Without this, a truncated or empty archive would "succeed" and the
+        # rows it never contained would be deleted below — permanent loss.
+        if compress_errors:
+            raise compress_errors[0]
         logging.info("Successfully wrote archive file.")
 
-        # 4. CRITICAL: Purge old records in a single, safe transaction
-        # This block ensures that DELETE only happens if the file write was successful.
+        # 4. CRITICAL: Purge old records, but in bounded chunks.
+        # A single DELETE covering a year of records would hold one huge
+        # transaction, bloat the journal, and keep the gateway's live writer
+        # thread locked out (SQLITE_BUSY) for the duration. Deleting in
+        # chunks with a commit between each keeps lock hold times short.
+        # The DELETE only starts after the archive file has been written
+        # and closed successfully.
         logging.info("Purging archived records from the live database...")
-        with conn: # Using 'with conn' creates an automatic transaction
-            cursor.execute("DELETE FROM fatigue_log WHERE timestamp < ?", (cutoff_date,))
-            logging.info(f"Successfully purged {cursor.rowcount} records from the live database.")
+        total_purged = 0
+        while True:
+            with conn:  # Using 'with conn' creates an automatic transaction per chunk
+                cursor.execute(
+                    "DELETE FROM fatigue_log WHERE log_id IN "
+                    "(SELECT log_id FROM fatigue_log WHERE timestamp < ? ORDER BY log_id LIMIT ?)",
+                    (cutoff_date, PURGE_CHUNK_SIZE)
+                )
+            if cursor.rowcount == 0:
+                break
+            total_purged += cursor.rowcount
+            logging.info(f"Purged chunk of {cursor.rowcount} records ({total_purged} total).")
+        logging.info(f"Successfully purged {total_purged} records from the live database.")
+
+        # 5. Hand freed pages back to the filesystem. Requires
+        # auto_vacuum=INCREMENTAL (set by db_setup.py); the page cap keeps
+        # the reclaim bounded so the live writer is not locked out the way a
+        # full VACUUM would. A no-op on databases without incremental vacuum.
+        logging.info("Reclaiming freed pages (incremental vacuum)...")
+        conn.execute("PRAGMA incremental_vacuum(1000)")
 
     except Exception as e:
         # Catch all exceptions to provide detailed logs for cron debugging
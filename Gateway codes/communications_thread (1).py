@@ -1,12 +1,22 @@
 import threading
 import logging
 import queue
+import select
 import time
 import serial
 import sqlite3
 import json
 from datetime import datetime
 from typing import Tuple
+
+# --- Safe import for orjson ---
+# orjson serializes via a C extension, several times faster than stdlib json
+# on the Pi. Fall back to stdlib json if it is not installed.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 # --- Configuration ---
 # These should be moved to a central, secure config file in a production deployment.
 ALERT_RECIPIENT_NUMBER = "+1234567890"  # Placeholder phone number
@@ -14,6 +24,9 @@ CLOUD_ENDPOINT_URL = "http://your-cloud-endpoint.com/api/setu-data" # Placeholde
 GPRS_APN = "your_apn"  # e.g., "internet" or "airtelgprs.com"
 GATEWAY_ID = "GW001"
 DATABASE_FILE = "setu_gateway.db"
+# Hard limit of a single SIM800L text-mode SMS (AT+CMGF=1). Bodies longer
+# than this either fail the CMGS outright or are truncated by the modem.
+SMS_MAX_CHARS = 160
 
 class SIM800LManager:
     """
@@ -37,21 +50,38 @@ class SIM800LManager:
         Returns: A tuple (bool, str) indicating success and the full response.
         """
         if not self.ser: return False, "Serial port not available"
-        
+
         logging.debug(f"Sending AT command: {command}")
         self.ser.write((command + '\r\n').encode())
-        
-        start_time = time.time()
-        response = ""
-        while time.time() - start_time < timeout:
-            line = self.ser.readline().decode('utf-8', 'ignore').strip()
-            if line:
-                logging.debug(f"SIM800L response: {line}")
-                response += line + "\n"
-                if expected_response in line:
-                    return True, response
+
+        # Read whatever bytes are pending in one go and scan the accumulated
+        # buffer for the expected token. Compared to the previous
+        # readline()-per-line loop this halves syscalls and avoids the
+        # quadratic string concatenation on long responses; decoding happens
+        # once at the end instead of per line.
+        # Block in select() until the modem has bytes ready (or the deadline
+        # passes), so the kernel does the waiting instead of a Python-level
+        # poll spinning on the clock.
+        expected = expected_response.encode()
+        buf = bytearray()
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select([self.ser.fileno()], [], [], remaining)
+            if not readable:
+                continue  # Deadline reached; loop exits on the next check
+            chunk = self.ser.read(self.ser.in_waiting or 1)
+            if not chunk:
+                continue
+            buf.extend(chunk)
+            if expected in buf:
+                response = buf.decode('utf-8', 'ignore')
+                logging.debug(f"SIM800L response: {response.strip()}")
+                return True, response
         logging.warning(f"Timeout waiting for '{expected_response}' for command '{command}'")
-        return False, response
+        return False, buf.decode('utf-8', 'ignore')
 
     def close(self):
         """Closes the serial port."""
@@ -70,8 +100,34 @@ class CommunicationsThread(threading.Thread):
         self.alert_q = alert_q
         self.shutdown_event = shutdown_event
         self.sim_manager = None
+        # Long-lived SQLite connection, created lazily on first use so it is
+        # owned by this thread (not the main thread that calls __init__).
+        self.db_conn = None
         logging.info("Communications Thread initialized.")
 
+    def _get_db_conn(self) -> sqlite3.Connection:
+        """
+        Returns the thread's cached SQLite connection, opening it on first
+        use. Reusing one connection avoids re-paying page-cache warmup and
+        WAL open on every 15-minute upload cycle.
+        """
+        if self.db_conn is None:
+            # isolation_level=None puts the connection in autocommit mode so
+            # transactions are opened explicitly. The ack-update uses BEGIN
+            # IMMEDIATE to take the write lock up front, rather than a
+            # deferred transaction that can hit SQLITE_BUSY when upgrading
+            # to a write lock mid-statement against the processing thread
+            # or the archive job.
+            self.db_conn = sqlite3.connect(DATABASE_FILE, isolation_level=None, timeout=30)
+            # synchronous and the cache sizing are per-connection PRAGMAs
+            # (unlike WAL, which persists in the file), so they must be
+            # re-applied on every long-lived connection that writes.
+            self.db_conn.execute("PRAGMA synchronous=NORMAL")
+            self.db_conn.execute("PRAGMA temp_store=MEMORY")
+            self.db_conn.execute("PRAGMA mmap_size=268435456")
+            self.db_conn.execute("PRAGMA cache_size=-20000")
+        return self.db_conn
+
     def setup_sms(self) -> bool:
         """Initializes the SIM800L module for sending SMS."""
         try:
@@ -121,14 +177,17 @@ class CommunicationsThread(threading.Thread):
         # It should be added with: ALTER TABLE fatigue_log ADD COLUMN sent_to_cloud INTEGER DEFAULT 0;
         
         # 1. Fetch unsent records from the database
-        db_conn = sqlite3.connect(DATABASE_FILE)
+        db_conn = self._get_db_conn()
         cursor = db_conn.cursor()
-        cursor.execute("SELECT log_id, node_id, timestamp, bin_1_cycles, bin_2_cycles, bin_3_cycles FROM fatigue_log WHERE sent_to_cloud = 0 LIMIT 50")
+        # ORDER BY log_id is served directly by the partial index (so it
+        # costs nothing) and it is what makes the BETWEEN ack below correct:
+        # without it, ascending rowid order is just the current query plan's
+        # behavior, not a guarantee.
+        cursor.execute("SELECT log_id, node_id, timestamp, bin_1_cycles, bin_2_cycles, bin_3_cycles FROM fatigue_log WHERE sent_to_cloud = 0 ORDER BY log_id LIMIT 50")
         records = cursor.fetchall()
-        
+
         if not records:
             logging.info("No new data to send.")
-            db_conn.close()
             return
             
         log_ids_to_update = [row[0] for row in records]
@@ -147,7 +206,10 @@ class CommunicationsThread(threading.Thread):
                 }
             } for row in records
         ]
-        json_payload = json.dumps(payload_data)
+        if ORJSON_AVAILABLE:
+            json_payload = orjson.dumps(payload_data).decode()
+        else:
+            json_payload = json.dumps(payload_data)
         
         # 3. Execute HTTP POST using AT commands
         success = self._http_post_payload(json_payload)
@@ -155,13 +217,29 @@ class CommunicationsThread(threading.Thread):
         # 4. CRITICAL: Update database only on successful transmission
         if success:
             logging.info(f"Successfully sent {len(records)} records. Updating database.")
-            placeholders = ','.join('?' for _ in log_ids_to_update)
-            cursor.execute(f"UPDATE fatigue_log SET sent_to_cloud = 1 WHERE log_id IN ({placeholders})", log_ids_to_update)
-            db_conn.commit()
+            # The SELECT is ordered by log_id, so min/max bound exactly the
+            # fetched set and a single BETWEEN covers it. The extra
+            # sent_to_cloud = 0 predicate makes it exact (ids inside the
+            # range that were already acked are untouched anyway) and lets
+            # the partial index serve the update. This replaces a
+            # 50-placeholder IN-list that forced a fresh query plan per call.
+            lo, hi = min(log_ids_to_update), max(log_ids_to_update)
+            try:
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute(
+                    "UPDATE fatigue_log SET sent_to_cloud = 1 "
+                    "WHERE sent_to_cloud = 0 AND log_id BETWEEN ? AND ?",
+                    (lo, hi)
+                )
+                cursor.execute("COMMIT")
+            except sqlite3.Error as e:
+                logging.error(f"Failed to ack uploaded records: {e}")
+                try:
+                    cursor.execute("ROLLBACK")
+                except sqlite3.Error:
+                    pass
         else:
             logging.error("Failed to send data to cloud. Database not updated.")
-            
-        db_conn.close()
 
     def _http_post_payload(self, payload: str) -> bool:
         """Handles the full AT command sequence for an HTTP POST request."""
@@ -220,13 +298,38 @@ class CommunicationsThread(threading.Thread):
                 if not is_sms_ready:
                     self.shutdown_event.wait(10)
                     continue
+            # Sleep exactly until the next cloud upload is due (capped at 1s
+            # so shutdown stays responsive) instead of a fixed 1s wakeup that
+            # both wastes idle cycles and lets a heavy alert stream starve
+            # the upload cadence.
+            cloud_wait = max(0.0, last_cloud_upload_time + 900 - time.time())
             try:
-                alert_message = self.alert_q.get(block=True, timeout=1.0)
-                if not self.send_sms(ALERT_RECIPIENT_NUMBER, alert_message):
-                    logging.warning("SMS failed. Re-queuing alert.")
-                    self.alert_q.put(alert_message)
-                    is_sms_ready = False
+                alert_message = self.alert_q.get(block=True, timeout=min(cloud_wait, 1.0))
                 self.alert_q.task_done()
+
+                # Coalesce the backlog: drain everything queued behind the
+                # first alert, then SMS only the most severe one rather than
+                # one SMS (tens of seconds of modem time) per alert. A
+                # rendered alert is already ~110 characters, so joining even
+                # two overflows the 160-character text-mode limit and the
+                # CMGS either fails (re-queue loop, nothing ever delivered)
+                # or the modem truncates away every later alert anyway.
+                alerts = [alert_message]
+                while True:
+                    try:
+                        alerts.append(self.alert_q.get_nowait())
+                        self.alert_q.task_done()
+                    except queue.Empty:
+                        break
+                alerts.sort(key=lambda msg: 0 if "CRITICAL" in msg else 1)
+                for skipped in alerts[1:]:
+                    # Not lost silently: the full backlog goes to the log.
+                    logging.warning("Alert coalesced out of SMS (logged only): %s", skipped)
+
+                if not self.send_sms(ALERT_RECIPIENT_NUMBER, alerts[0][:SMS_MAX_CHARS]):
+                    logging.warning("SMS failed. Re-queuing most severe alert.")
+                    self.alert_q.put(alerts[0])
+                    is_sms_ready = False
             except queue.Empty:
                 pass # Normal timeout, no alerts to send
             except Exception as e:
@@ -240,4 +343,6 @@ class CommunicationsThread(threading.Thread):
 
         if self.sim_manager:
             self.sim_manager.close()
+        if self.db_conn:
+            self.db_conn.close()
         logging.info("Communications Thread shutting down.")
@@ -16,6 +16,27 @@ def setup_database():
         conn = sqlite3.connect(DATABASE_FILE)
         cursor = conn.cursor()
 
+        # --- Performance PRAGMAs (must run before any tables are created) ---
+        # WAL lets the comms thread's SELECTs and the archive job's DELETEs
+        # run concurrently with the processing thread's INSERTs instead of
+        # taking a global lock. synchronous=NORMAL is safe under WAL and
+        # avoids an fsync on every commit. page_size only takes effect on an
+        # empty database, which is why these run first. journal_mode and
+        # page_size are persistent; the rest are set defensively here and
+        # again by long-lived connections if needed.
+        logging.info("Applying performance PRAGMAs...")
+        cursor.execute("PRAGMA page_size=32768")
+        # Incremental auto-vacuum lets the archive job hand freed pages back
+        # to the filesystem after its yearly purge without a full VACUUM
+        # locking out the gateway. Like page_size, this only takes effect on
+        # an empty database.
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-20000")
+
         # Create the 'nodes' table for sensor metadata
         logging.info("Creating 'nodes' table if not exists...")
         cursor.execute('''
@@ -41,6 +62,22 @@ def setup_database():
         )
         ''')
 
+        # Index the timestamp column so the archive job's range queries
+        # (SELECT/DELETE ... WHERE timestamp < ?) seek instead of scanning
+        # the whole table.
+        logging.info("Creating indexes on 'fatigue_log' if not exists...")
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fatigue_log_ts ON fatigue_log(timestamp)
+        ''')
+
+        # Partial index covering only unsent rows. The cloud forwarder polls
+        # "WHERE sent_to_cloud = 0" every 15 minutes; this keeps that lookup
+        # cheap no matter how large the table grows.
+        cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_fatigue_log_sent ON fatigue_log(sent_to_cloud)
+        WHERE sent_to_cloud = 0
+        ''')
+
         # =================================================================
         # TASK GW-2: ADD THE NEW TABLE CREATION LOGIC HERE
         # =================================================================
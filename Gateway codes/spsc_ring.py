@@ -0,0 +1,66 @@
+"""
+Lock-free single-producer / single-consumer ring buffer.
+
+The high-priority LoRa path has exactly one producer (the LoRa worker) and
+one consumer (the data processing thread), so the mutex + condition variable
+inside queue.Queue is pure overhead there. In this ring the producer only
+ever writes the head index and the consumer only ever writes the tail index;
+under CPython's GIL each of those single-word stores is atomic, so no lock
+is needed at all. Enqueue and dequeue collapse to a couple of memory
+operations plus a modulo.
+
+Not safe for multiple producers or multiple consumers — use queue.Queue for
+those paths (the nRF low-priority path still does).
+"""
+
+
+class SPSCRing:
+    """Fixed-capacity single-producer/single-consumer ring."""
+
+    def __init__(self, capacity: int):
+        # One slot is sacrificed to distinguish full from empty, so the ring
+        # holds at most capacity - 1 items.
+        self._buf = [None] * capacity
+        self._n = capacity
+        self._head = 0  # Next write slot. Only the producer mutates this.
+        self._tail = 0  # Next read slot. Only the consumer mutates this.
+
+    def enqueue(self, item) -> bool:
+        """
+        Producer side: appends an item. Returns False (without blocking) if
+        the ring is full, leaving the drop policy to the caller.
+        """
+        head = self._head
+        nxt = (head + 1) % self._n
+        if nxt == self._tail:
+            return False
+        self._buf[head] = item
+        self._head = nxt
+        return True
+
+    def dequeue(self):
+        """
+        Consumer side: removes and returns the oldest item, or None if the
+        ring is empty. Never blocks.
+        """
+        tail = self._tail
+        if tail == self._head:
+            return None
+        item = self._buf[tail]
+        self._buf[tail] = None  # Drop the reference so the payload can be freed
+        self._tail = (tail + 1) % self._n
+        return item
+
+    def drain(self, limit: int) -> list:
+        """Consumer side: dequeues up to 'limit' items into a list."""
+        items = []
+        while len(items) < limit:
+            item = self.dequeue()
+            if item is None:
+                break
+            items.append(item)
+        return items
+
+    def __len__(self):
+        """Approximate occupancy (exact for the thread that owns either end)."""
+        return (self._head - self._tail) % self._n